@@ -1,10 +1,18 @@
 
+import os
 import socket
 import threading
-import random
-import pickle
+import numpy as np
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import Queue
 from time import time
-from typing import List, Tuple
+from typing import Dict, List, Tuple
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:  # cryptography is optional; fall back to os.urandom
+    Cipher = None
+from protocol import (MAX_VECTOR_LENGTH, tune_socket, send_msg, recv_msg, pack_preprocessing_header,
+                      pack_online_header, pack_rows, pack_vectors, unpack_vectors, unpack_result)
 
 # Configuration
 NUM_PARTIES = 3
@@ -12,39 +20,100 @@ HOST = 'localhost'
 PORT = 9999
 SHARE_TYPE = "additive"  # "xor" or "additive"
 MODULUS = 67  # Prime field for additive sharing
+BATCH_SIZE = 1024  # Beaver triples per producer batch
+TRIPLE_QUEUE_SIZE = 2  # Triple batches generated ahead of use
+
+class AESPRG:
+    """AES-128-CTR keystream PRG seeded from os.urandom"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.encryptor = None
+        if Cipher is not None:
+            seed = os.urandom(16)
+            self.encryptor = Cipher(algorithms.AES(seed), modes.CTR(bytes(16))).encryptor()
+
+    def bytes(self, n: int) -> bytes:
+        """Return the next n pseudorandom bytes"""
+        if self.encryptor is None:
+            return os.urandom(n)
+        with self.lock:  # Shared by the triple producer and the main thread
+            return self.encryptor.update(bytes(n))
 
 class MPCCoordinator:
     def __init__(self):
         self.clients = []
         self.lock = threading.Lock()
-
-    def share_secret(self, secret: int) -> List[int]:
-        """Generate secret shares for additive or XOR sharing"""
+        self.prg = AESPRG()
+        self.beaver_rows = None  # (NUM_PARTIES, 3*n) a/b/c shares in flight
+        self.outboxes = []  # Per-party queues of (message parts, Future or None) pairs
+        self.pool = ThreadPoolExecutor(max_workers=NUM_PARTIES)
+        self.shutdown = threading.Event()
+        self.triple_queue = Queue(maxsize=TRIPLE_QUEUE_SIZE)
+        threading.Thread(target=self.triple_producer, daemon=True).start()
+
+    def random_elements(self, shape) -> np.ndarray:
+        """Draw uniform field elements (or bits for XOR) from the PRG"""
+        count = int(np.prod(shape))
+        if SHARE_TYPE != "additive":
+            raw = np.frombuffer(self.prg.bytes(count), dtype=np.uint8)
+            return (raw & 1).astype(np.int64).reshape(shape)
+        # Rejection sampling keeps the draw exactly uniform over [0, MODULUS)
+        limit = 256 - 256 % MODULUS
+        out = np.empty(0, dtype=np.uint8)
+        while len(out) < count:
+            raw = np.frombuffer(self.prg.bytes(count - len(out)), dtype=np.uint8)
+            out = np.concatenate([out, raw[raw < limit]])
+        return (out % MODULUS).astype(np.int64).reshape(shape)
+
+    def share_secret_batch(self, secrets: np.ndarray) -> np.ndarray:
+        """Generate secret shares for a vector of secrets
+
+        Returns a (NUM_PARTIES, n) array where row i holds party i's shares.
+        """
+        secrets = np.asarray(secrets, dtype=np.int64)
+        shares = self.random_elements((len(secrets), NUM_PARTIES-1))
         if SHARE_TYPE == "additive":
-            shares = [random.randint(0, MODULUS-1) for _ in range(NUM_PARTIES-1)]
-            shares.append((secret - sum(shares)) % MODULUS)
+            last = (secrets - shares.sum(axis=1)) % MODULUS
         else:  # XOR sharing
-            assert secret in (0, 1), "XOR sharing requires binary inputs"
-            shares = [random.randint(0, 1) for _ in range(NUM_PARTIES-1)]
-            shares.append(secret ^ sum(shares) % 2)
-        return shares
-
-    def generate_beaver_triples(self, n: int) -> Tuple[List, List, List]:
-        """Generate Beaver triples for n parallel multiplications"""
-        a_list, b_list, c_list = [], [], []
-        for _ in range(n):
-            if SHARE_TYPE == "additive":
-                a = random.randint(0, MODULUS-1)
-                b = random.randint(0, MODULUS-1)
-                c = (a * b) % MODULUS
-            else:
-                a = random.randint(0, 1)
-                b = random.randint(0, 1)
-                c = a & b
-            a_list.append(self.share_secret(a))
-            b_list.append(self.share_secret(b))
-            c_list.append(self.share_secret(c))
-        return a_list, b_list, c_list
+            assert np.isin(secrets, (0, 1)).all(), "XOR sharing requires binary inputs"
+            last = secrets ^ (shares.sum(axis=1) % 2)
+        return np.vstack([shares.T, last])
+
+    def generate_beaver_triples(self, n: int) -> Dict[str, np.ndarray]:
+        """Generate Beaver triples for n parallel multiplications
+
+        Returns the a, b and c share arrays, each shaped (NUM_PARTIES, n).
+        """
+        a = self.random_elements(n)
+        b = self.random_elements(n)
+        c = (a * b) % MODULUS if SHARE_TYPE == "additive" else a & b
+        triples = self.share_secret_batch(np.concatenate([a, b, c]))
+        return {'a': triples[:, :n], 'b': triples[:, n:2*n], 'c': triples[:, 2*n:]}
+
+    def exchange(self, messages: List[Tuple]) -> List[bytearray]:
+        """Hand message parts messages[i] to party i's handler and wait for every reply"""
+        futures = []
+        for outbox, parts in zip(self.outboxes, messages):
+            future = Future()
+            outbox.put((parts, future))
+            futures.append(future)
+        return [f.result() for f in futures]
+
+    def send(self, messages: List[Tuple]):
+        """Queue message parts messages[i] for party i without waiting for a reply"""
+        for outbox, parts in zip(self.outboxes, messages):
+            outbox.put((parts, None))
+
+    def triple_producer(self):
+        """Offline phase: keep the triple queue topped up with fresh batches"""
+        while True:
+            self.triple_queue.put(self.generate_beaver_triples(BATCH_SIZE))
+
+    def reconstruct(self, shares: np.ndarray) -> np.ndarray:
+        """Combine shares stacked along axis 0 (one row per party)"""
+        if SHARE_TYPE == "additive":
+            return shares.sum(axis=0, dtype=np.int64) % MODULUS
+        return np.bitwise_xor.reduce(shares.astype(np.int64), axis=0)
 
     def run_computation(self):
         """Main MPC computation workflow"""
@@ -59,75 +128,31 @@ class MPCCoordinator:
         print(f"x = {x_vec}")
         print(f"y = {y_vec}")
 
-        # Phase 1: Share inputs and Beaver triples
-        x_shares = [self.share_secret(x) for x in x_vec]
-        y_shares = [self.share_secret(y) for y in y_vec]
-        a_shares, b_shares, c_shares = self.generate_beaver_triples(n)
-
-        # Send data to parties
-        for i, client in enumerate(self.clients):
-            data = {
-                'x_vec': [x_shares[j][i] for j in range(n)],
-                'y_vec': [y_shares[j][i] for j in range(n)],
-                'beavers': [{
-                    'a': a_shares[j][i],
-                    'b': b_shares[j][i],
-                    'c': c_shares[j][i]
-                } for j in range(n)],
-                'type': SHARE_TYPE,
-                'mod': MODULUS,
-                'compute_dot': True  # Request dot product computation
-            }
-            client.sendall(pickle.dumps(data))
-
-        # Phase 2: Collect masked values
-        responses = [pickle.loads(client.recv(4096)) for client in self.clients]
-        d_vec = [0] * n
-        e_vec = [0] * n
-
-        for r in responses:
-            for j in range(n):
-                if SHARE_TYPE == "additive":
-                    d_vec[j] = (d_vec[j] + r['d'][j]) % MODULUS
-                    e_vec[j] = (e_vec[j] + r['e'][j]) % MODULUS
-                else:
-                    d_vec[j] ^= r['d'][j]
-                    e_vec[j] ^= r['e'][j]
-
-        # Phase 3: Compute and share d*e terms
-        if SHARE_TYPE == "additive":
-            de_shares = [self.share_secret((d_vec[j] * e_vec[j]) % MODULUS) for j in range(n)]
-        else:
-            de_shares = [[] for _ in range(n)]  # Not needed for XOR
-
-        # Send reconstruction data
-        for i, client in enumerate(self.clients):
-            msg = {
-                'd_vec': d_vec,
-                'e_vec': e_vec,
-                'de_shares': [de_shares[j][i] for j in range(n)] if SHARE_TYPE == "additive" else []
-            }
-            client.sendall(pickle.dumps(msg))
-
-        # Phase 4: Collect results
-        result_shares = [pickle.loads(client.recv(4096)) for client in self.clients]
-        
-        # Reconstruct individual products
-        products = [0] * n
-        for r in result_shares:
-            for j in range(n):
-                if SHARE_TYPE == "additive":
-                    products[j] = (products[j] + r['products'][j]) % MODULUS
-                else:
-                    products[j] ^= r['products'][j]
-
-        # Reconstruct dot product
-        dot_product = 0
-        for r in result_shares:
-            if SHARE_TYPE == "additive":
-                dot_product = (dot_product + r['dot_product']) % MODULUS
-            else:
-                dot_product ^= r['dot_product']
+        if n > MAX_VECTOR_LENGTH:
+            raise ValueError(f"Input vectors of length {n} exceed the {MAX_VECTOR_LENGTH} element limit")
+
+        # Offline phase: ship fresh triples ahead of the online messages
+        self.send_preprocessing(n)
+
+        # Phase 1: Share inputs
+        x_shares = self.share_secret_batch(x_vec)
+        y_shares = self.share_secret_batch(y_vec)
+
+        # Send data to parties and collect masked values (Phase 2)
+        header = pack_online_header(True, n)  # Request dot product computation
+        rows = pack_rows(x_shares, y_shares)
+        messages = [(header, rows[i]) for i in range(NUM_PARTIES)]
+        responses = np.stack([unpack_vectors(r, n, 2) for r in self.exchange(messages)])
+        d_vec, e_vec = self.reconstruct(responses)
+
+        # Phase 3: Broadcast public d, e; party 0 adds the public d*e term itself
+        public = pack_vectors(d_vec, e_vec)
+        messages = [(public,)] * NUM_PARTIES
+        result_shares = [unpack_result(r, n) for r in self.exchange(messages)]
+
+        # Reconstruct individual products and dot product
+        products = self.reconstruct(np.stack([r_products for r_products, _ in result_shares])).tolist()
+        dot_product = int(self.reconstruct(np.array([r_dot for _, r_dot in result_shares])))
 
         # Verification
         expected_products = [
@@ -142,32 +167,85 @@ class MPCCoordinator:
         print(f"\nSecure Dot Product: {dot_product}")
         print(f"Actual Dot Product: {expected_dot}")
 
+    def send_preprocessing(self, n: int):
+        """Offline phase: ship every party its shares of n fresh triples
+
+        Takes ceil(n / BATCH_SIZE) batches from the producer queue and sends
+        exactly n triples; the unused tail of the last batch is dropped, so
+        no triple is ever sent twice (reuse would leak input differences).
+        """
+        batches = [self.triple_queue.get() for _ in range(-(-n // BATCH_SIZE))]
+        self.beaver_rows = pack_rows(*(
+            np.concatenate([batch[k] for batch in batches], axis=1)[:, :n] for k in 'abc'
+        ))
+        self.send([
+            (pack_preprocessing_header(SHARE_TYPE, i, MODULUS, n), self.beaver_rows[i])
+            for i in range(NUM_PARTIES)
+        ])
+        self.beaver_rows = None
+
     def start(self):
         """Start the coordinator server"""
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            tune_socket(s)  # Buffer sizes must be set before listen() to shape the TCP window
             s.bind((HOST, PORT))
             s.listen()
             print(f"MPC Coordinator waiting for {NUM_PARTIES} parties...")
 
-            while len(self.clients) < NUM_PARTIES:
-                conn, addr = s.accept()
-                with self.lock:
-                    self.clients.append(conn)
-                print(f"[+] Party connected: {addr}")
-                threading.Thread(target=self.handle_client, args=(conn, addr), daemon=True).start()
-
-            # All parties connected, start computation
-            self.run_computation()
-
-            # Keep server alive
-            while True:
+            try:
+                while len(self.clients) < NUM_PARTIES:
+                    conn, addr = s.accept()
+                    tune_socket(conn)
+                    outbox = Queue()
+                    with self.lock:
+                        self.clients.append(conn)
+                        self.outboxes.append(outbox)
+                    print(f"[+] Party connected: {addr}")
+                    self.pool.submit(self.handle_client, conn, addr, outbox)
+
+                # All parties connected, start computation
+                self.run_computation()
+
+                # Keep server alive until interrupted
+                self.shutdown.wait()
+            except KeyboardInterrupt:
+                self.shutdown.set()
+            finally:
+                self.stop_handlers()
+
+    def stop_handlers(self):
+        """Release every party handler so the pool's workers can exit"""
+        for outbox in self.outboxes:
+            outbox.put(None)
+        for conn in self.clients:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)  # Unblock a handler stuck in recv
+            except OSError:
                 pass
+        self.pool.shutdown()
 
-    def handle_client(self, conn, addr):
-        """Handle client connections"""
+    def handle_client(self, conn, addr, outbox: Queue):
+        """Serve one party: run its queued sends and exchanges in order"""
+        error = None
         with conn:
             while True:
-                pass  # All communication handled in main thread
+                item = outbox.get()
+                if item is None:
+                    break
+                parts, future = item
+                if error is not None:
+                    # The socket is dead; fail this and every later exchange
+                    if future is not None:
+                        future.set_exception(error)
+                    continue
+                try:
+                    send_msg(conn, *parts)
+                    if future is not None:
+                        future.set_result(recv_msg(conn))
+                except Exception as exc:
+                    error = exc
+                    if future is not None:
+                        future.set_exception(exc)
 
 if __name__ == "__main__":
     coordinator = MPCCoordinator()
@@ -1,85 +1,179 @@
 import socket
-import pickle
+from abc import ABC, abstractmethod
+from collections import deque
+import numpy as np
 from typing import Dict, List
+try:
+    from numba import njit, prange
+except ImportError:  # Numba is optional; fall back to the NumPy kernel
+    njit = None
+from protocol import (PREPROCESSING, tune_socket, send_msg, recv_msg, message_type, pack_vectors,
+                      unpack_vectors, unpack_preprocessing, unpack_online, pack_result)
 
 HOST = 'localhost'
 PORT = 9999
 
-class MPCParty:
-    def __init__(self):
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+def pack_bits(bits: List[int]) -> np.ndarray:
+    """Pack a bit vector into uint64 words, 64 bits per lane"""
+    packed = np.packbits(np.asarray(bits, dtype=np.uint8))
+    padded = np.zeros(-(-len(packed) // 8) * 8, dtype=np.uint8)
+    padded[:len(packed)] = packed
+    return padded.view(np.uint64)
 
-    def connect(self):
-        """Connect to the coordinator"""
-        self.socket.connect((HOST, PORT))
-        self.run_protocol()
+def unpack_bits(words: np.ndarray, n: int) -> List[int]:
+    """Unpack the first n bits of a uint64 word array"""
+    return np.unpackbits(words.view(np.uint8))[:n].tolist()
+
+def parity(words: np.ndarray) -> int:
+    """XOR of all bits in a uint64 word array"""
+    return sum(bin(int(w)).count('1') for w in words) & 1
+
+def barrett_reduce(x: np.ndarray, mod: int, out: np.ndarray = None) -> np.ndarray:
+    """Compute x % mod for uint32 arrays with x < 2**16 without a divide"""
+    # floor(2**16 / mod) underestimates the quotient by at most one
+    q = x * ((1 << 16) // mod)
+    q >>= 16
+    q *= mod
+    r = np.subtract(x, q, out=out)
+    np.subtract(r, mod, out=r, where=r >= mod)
+    return r
+
+if njit is not None:
+    # The explicit signature compiles eagerly at import, before connecting,
+    # so the first call never stalls an online round on JIT compilation
+    @njit("Tuple((uint32[:], int64))(uint32[:], uint32[:], uint32[:], uint32[:], uint32[:], uint32[:], int64)",
+          parallel=True, cache=True)
+    def recombine(a, b, c, d, e, de, mod):
+        """Additive Beaver recombination and its sum, parallel over elements"""
+        n = len(a)
+        barrett = (1 << 16) // mod
+        products = np.empty(n, dtype=np.uint32)
+        dot = 0
+        for i in prange(n):
+            t = np.int64(de[i]) + np.int64(d[i]) * b[i] + np.int64(e[i]) * a[i] + c[i]
+            r = t - ((t * barrett) >> 16) * mod
+            if r >= mod:
+                r -= mod
+            products[i] = r
+            dot += r
+        return products, dot % mod
+else:
+    def recombine(a, b, c, d, e, de, mod):
+        """Additive Beaver recombination and its sum, accumulated in one buffer"""
+        t = d * b
+        t += e * a
+        t += de
+        t += c
+        barrett_reduce(t, mod, out=t)
+        return t, int(t.sum()) % mod
+
+class MPCParty(ABC):
+    """Connection, preprocessing and message flow shared by both protocols"""
+    share_type = None
+
+    def __init__(self, sock: socket.socket, party_id: int):
+        self.socket = sock
+        self.party_id = party_id
+        self.triples = deque()  # Preprocessed (mod, a/b/c) batches
+
+    @staticmethod
+    def create(share_type: str, sock: socket.socket, party_id: int) -> 'MPCParty':
+        """Return the party specialized for share_type"""
+        if share_type == "xor":
+            return MPCXorParty(sock, party_id)
+        return MPCAdditiveParty(sock, party_id)
+
+    @staticmethod
+    def connect() -> 'MPCParty':
+        """Connect to the coordinator and specialize on its first preprocessing header"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        tune_socket(sock)
+        sock.connect((HOST, PORT))
+        share_type, party_id, mod, triples = unpack_preprocessing(recv_msg(sock))
+        party = MPCParty.create(share_type, sock, party_id)
+        party.triples.append((mod, triples))
+        return party
+
+    def queue_preprocessing(self, buf: bytes):
+        """Offline phase: queue a further batch of Beaver triple shares"""
+        share_type, _, mod, triples = unpack_preprocessing(buf)
+        if share_type != self.share_type:
+            raise ValueError(f"Expected {self.share_type} triples, got {share_type}")
+        self.triples.append((mod, triples))
 
     def run_protocol(self):
         """Execute the MPC protocol"""
-        # Phase 1: Receive shares and Beaver triples
-        data = pickle.loads(self.socket.recv(4096))
-        x_vec = data['x_vec']
-        y_vec = data['y_vec']
-        beavers = data['beavers']
-        share_type = data['type']
-        mod = data['mod']
-        compute_dot = data.get('compute_dot', False)
+        # Phase 1: Queue any triple batches sent ahead of the online message
+        buf = recv_msg(self.socket)
+        while message_type(buf) == PREPROCESSING:
+            self.queue_preprocessing(buf)
+            buf = recv_msg(self.socket)
+
+        # Take a preprocessed triple batch and read the input shares
+        mod, (a, b, c) = self.triples.popleft()
+        compute_dot, (x_vec, y_vec) = unpack_online(buf)
         n = len(x_vec)
+        if len(a) < n:
+            raise ValueError(f"Triple batch of {len(a)} cannot cover {n} inputs")
+        products, dot_share = self.multiply(x_vec, y_vec, a[:n], b[:n], c[:n], mod, n)
+
+        # Send results
+        send_msg(self.socket, pack_result(products, dot_share if compute_dot else 0))
+
+    @abstractmethod
+    def multiply(self, x_vec, y_vec, a_vec, b_vec, c_vec, mod, n):
+        """Run Phases 2-4 and return (product shares, dot product share)"""
+
+class MPCAdditiveParty(MPCParty):
+    share_type = "additive"
+
+    def multiply(self, x_vec, y_vec, a_vec, b_vec, c_vec, mod, n):
+        """Additive Beaver multiplication, vectorized over all n elements"""
+        # d*e + d*b + e*a + c stays below 2**16 for any modulus below 128,
+        # and uint32 leaves room for the Barrett multiply
+        x = x_vec.astype(np.uint32)
+        y = y_vec.astype(np.uint32)
+        a = a_vec.astype(np.uint32)
+        b = b_vec.astype(np.uint32)
+        c = c_vec.astype(np.uint32)
 
         # Phase 2: Compute masked values
-        d_vec, e_vec = [], []
-        for i in range(n):
-            x = x_vec[i]
-            y = y_vec[i]
-            a = beavers[i]['a']
-            b = beavers[i]['b']
-            
-            if share_type == "additive":
-                d = (x - a) % mod
-                e = (y - b) % mod
-            else:  # XOR
-                d = x ^ a
-                e = y ^ b
-            
-            d_vec.append(d)
-            e_vec.append(e)
-
-        self.socket.sendall(pickle.dumps({'d': d_vec, 'e': e_vec}))
+        d = barrett_reduce(x + mod - a, mod)
+        e = barrett_reduce(y + mod - b, mod)
+        send_msg(self.socket, pack_vectors(d, e))
 
         # Phase 3: Receive public values
-        msg = pickle.loads(self.socket.recv(4096))
-        d_vec = msg['d_vec']
-        e_vec = msg['e_vec']
-        de_shares = msg.get('de_shares', [])
+        d, e = unpack_vectors(recv_msg(self.socket), n, 2).astype(np.uint32)
+        de = d * e if self.party_id == 0 else np.zeros_like(d)  # Public term, added once
 
         # Phase 4: Compute shares
-        products = []
-        dot_share = 0
-        
-        for i in range(n):
-            a = beavers[i]['a']
-            b = beavers[i]['b']
-            c = beavers[i]['c']
-            
-            if share_type == "additive":
-                term = (de_shares[i] + d_vec[i] * b + e_vec[i] * a + c) % mod
-            else:  # XOR
-                term = (d_vec[i] & b) ^ (e_vec[i] & a) ^ c
-            
-            products.append(term)
-            if compute_dot:
-                if share_type == "additive":
-                    dot_share = (dot_share + term) % mod
-                else:
-                    dot_share ^= term
+        products, dot_share = recombine(a, b, c, d, e, de, mod)
+        return products, int(dot_share)
 
-        # Send results
-        result = {
-            'products': products,
-            'dot_product': dot_share if compute_dot else None
-        }
-        self.socket.sendall(pickle.dumps(result))
+class MPCXorParty(MPCParty):
+    share_type = "xor"
+
+    def multiply(self, x_vec, y_vec, a_vec, b_vec, c_vec, mod, n):
+        """XOR Beaver multiplication on bits packed 64 to a uint64 word"""
+        x = pack_bits(x_vec)
+        y = pack_bits(y_vec)
+        a = pack_bits(a_vec)
+        b = pack_bits(b_vec)
+        c = pack_bits(c_vec)
+
+        # Phase 2: Compute masked values
+        d = x ^ a
+        e = y ^ b
+        send_msg(self.socket, pack_vectors(unpack_bits(d, n), unpack_bits(e, n)))
+
+        # Phase 3: Receive public values
+        d, e = (pack_bits(v) for v in unpack_vectors(recv_msg(self.socket), n, 2))
+        de = d & e if self.party_id == 0 else np.zeros_like(d)  # Public term, added once
+
+        # Phase 4: Compute shares
+        term = de ^ (d & b) ^ (e & a) ^ c
+        return unpack_bits(term, n), parity(term)
 
 if __name__ == "__main__":
-    party = MPCParty()
-    party.connect()
+    party = MPCParty.connect()
+    party.run_protocol()
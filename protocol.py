@@ -0,0 +1,110 @@
+import socket
+import struct
+import numpy as np
+from typing import Tuple
+
+# Wire format shared by coordinator and parties. Every share fits in one
+# byte (MODULUS < 256, XOR shares are bits), so vectors travel as raw uint8.
+SHARE_TYPES = {"additive": 0, "xor": 1}
+SHARE_TYPE_NAMES = {code: name for name, code in SHARE_TYPES.items()}
+# Coordinator-to-party messages open with a type byte so parties can tell a
+# new triple batch from the start of an online run
+PREPROCESSING, ONLINE = 0, 1
+PREPROCESSING_HEADER = struct.Struct('<BBBIB')  # message type, share type, party id, n, modulus
+ONLINE_HEADER = struct.Struct('<BIB')  # message type, n, compute_dot
+# Largest n whose 3n-byte triple message still fits the 4-byte length prefix
+MAX_VECTOR_LENGTH = ((1 << 32) - 1 - PREPROCESSING_HEADER.size) // 3
+SOCKET_BUFFER_SIZE = 1 << 20  # Kernel send/receive buffer for large batches
+
+def tune_socket(sock: socket.socket):
+    """Disable Nagle and enlarge kernel buffers for the protocol's small round-trips"""
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+
+def recv_exact(sock: socket.socket, n_bytes: int) -> bytearray:
+    """Read exactly n_bytes from sock"""
+    buf = bytearray(n_bytes)
+    view = memoryview(buf)
+    received = 0
+    while received < n_bytes:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionError("Connection closed mid-message")
+        received += count
+    return buf
+
+def send_msg(sock: socket.socket, *parts):
+    """Send parts as one message with a 4-byte big-endian length prefix
+
+    Where sendmsg exists, parts are written scatter-gather, so shared headers
+    and per-party buffer rows go out without being concatenated first.
+    Elsewhere (e.g. Windows) they are joined and sent with sendall.
+    """
+    views = [memoryview(p).cast('B') for p in parts]
+    views.insert(0, memoryview(sum(len(v) for v in views).to_bytes(4, 'big')))
+    if not hasattr(sock, 'sendmsg'):
+        sock.sendall(b''.join(views))
+        return
+    while views:
+        sent = sock.sendmsg(views)
+        while views and sent >= len(views[0]):
+            sent -= len(views.pop(0))
+        if sent:
+            views[0] = views[0][sent:]
+
+def recv_msg(sock: socket.socket) -> bytearray:
+    """Receive one length-prefixed message"""
+    header = recv_exact(sock, 4)
+    return recv_exact(sock, int.from_bytes(header, 'big'))
+
+def pack_vectors(*vectors) -> bytes:
+    """Concatenate equal-length share vectors as uint8 blocks"""
+    return b''.join(np.asarray(v, dtype=np.uint8).tobytes() for v in vectors)
+
+def pack_rows(*share_arrays) -> np.ndarray:
+    """Lay out (parties, n) share arrays as one contiguous (parties, fields*n) uint8 buffer"""
+    return np.ascontiguousarray(np.concatenate(share_arrays, axis=1), dtype=np.uint8)
+
+def unpack_vectors(buf: bytes, n: int, count: int, offset: int = 0) -> np.ndarray:
+    """Read count uint8 vectors of length n, returned as a (count, n) array"""
+    return np.frombuffer(buf, dtype=np.uint8, count=count*n, offset=offset).reshape(count, n)
+
+def message_type(buf: bytes) -> int:
+    """Return the type byte of a coordinator-to-party message"""
+    return buf[0]
+
+def expect_message_type(buf: bytes, expected: int):
+    """Raise ValueError unless buf is a message of the expected type"""
+    if message_type(buf) != expected:
+        raise ValueError(f"Expected message type {expected}, got {message_type(buf)}")
+
+def pack_preprocessing_header(share_type: str, party_id: int, mod: int, n: int) -> bytes:
+    """Offline message header; followed on the wire by the party's a, b, c row"""
+    return PREPROCESSING_HEADER.pack(PREPROCESSING, SHARE_TYPES[share_type], party_id, n, mod)
+
+def unpack_preprocessing(buf: bytes) -> Tuple[str, int, int, np.ndarray]:
+    """Parse an offline message into share type, party id, modulus and a (3, n) a/b/c array"""
+    expect_message_type(buf, PREPROCESSING)
+    _, type_code, party_id, n, mod = PREPROCESSING_HEADER.unpack_from(buf)
+    triples = unpack_vectors(buf, n, 3, offset=PREPROCESSING_HEADER.size)
+    return SHARE_TYPE_NAMES[type_code], party_id, mod, triples
+
+def pack_online_header(compute_dot: bool, n: int) -> bytes:
+    """Online Phase 1 header; followed on the wire by the party's x, y row"""
+    return ONLINE_HEADER.pack(ONLINE, n, compute_dot)
+
+def unpack_online(buf: bytes) -> Tuple[bool, np.ndarray]:
+    """Parse an online Phase 1 message into compute_dot and a (2, n) x/y array"""
+    expect_message_type(buf, ONLINE)
+    _, n, compute_dot = ONLINE_HEADER.unpack_from(buf)
+    return bool(compute_dot), unpack_vectors(buf, n, 2, offset=ONLINE_HEADER.size)
+
+def pack_result(products, dot_share: int) -> bytes:
+    """Phase 4 message: product shares followed by the dot product share"""
+    return pack_vectors(products, [dot_share])
+
+def unpack_result(buf: bytes, n: int) -> Tuple[np.ndarray, int]:
+    """Parse a Phase 4 message into product shares and the dot product share"""
+    values = np.frombuffer(buf, dtype=np.uint8, count=n+1)
+    return values[:n], int(values[n])